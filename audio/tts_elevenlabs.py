@@ -9,7 +9,6 @@ from elevenlabs.client import ElevenLabs
 from pydub import AudioSegment
 from pydub.playback import play
 from nltk.tokenize import sent_tokenize
-import asyncio
 import logging
 from concurrent.futures import ThreadPoolExecutor
 
@@ -94,13 +93,39 @@ async def text_to_speech_stream(text: str, voice_id: str = "pNInz6obpgDQGcFmaJgB
             print(f"Returning path={session_file_path} cached audio for text: '{text}' <--------------")
             return session_file_path
 
-    # Generate new audio if not cached
-    global file_count
-    file_count += 1
-    filename = f"{voice_id}_{file_hash}.mp3"
-    session_file_path = os.path.join(output_dir, filename)
+    # Generate new audio if not cached (joining a synthesis already in flight for the same clip)
+    task = synthesis_in_flight.get(file_hash)
+    if task is None:
+        task = start_synthesis(text, voice_id)
+    return await asyncio.shield(task)
 
-    # Convert text to speech
+# Synthesis tasks that have not finished yet, keyed by generate_hash(text, voice_id)
+synthesis_in_flight = {}
+
+def start_synthesis(text: str, voice_id: str) -> asyncio.Task:
+    file_hash = generate_hash(text, voice_id)
+    task = asyncio.create_task(generate_speech(text, voice_id, file_hash))
+    synthesis_in_flight[file_hash] = task
+    task.add_done_callback(lambda task: synthesis_done(file_hash, task))
+    return task
+
+def synthesis_done(file_hash: str, task: asyncio.Task) -> None:
+    synthesis_in_flight.pop(file_hash, None)
+    # A prefetched clip may never be awaited, so its failure is reported here
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Speech synthesis failed for {file_hash}: {task.exception()}")
+
+def prefetch_speech(text: str, voice_id: str = "pNInz6obpgDQGcFmaJgB") -> None:
+    """Start synthesizing a clip in the background so a later text_to_speech_stream call finds it ready."""
+    file_hash = generate_hash(text, voice_id)
+    if file_hash in synthesis_in_flight:
+        return
+    if file_hash in audio_cache and os.path.exists(audio_cache[file_hash]):
+        return
+    start_synthesis(text, voice_id)
+
+def synthesize_to_file(text: str, voice_id: str, file_path: str) -> None:
+    # Blocking ElevenLabs request: run it in a thread so several clips can be generated at once
     response = client.text_to_speech.convert(
         voice_id=voice_id,
         output_format="mp3_22050_32",
@@ -114,10 +139,19 @@ async def text_to_speech_stream(text: str, voice_id: str = "pNInz6obpgDQGcFmaJgB
         ),
     )
     
-    with open(session_file_path, "wb") as f:
+    with open(file_path, "wb") as f:
         for chunk in response:
             f.write(chunk)
 
+async def generate_speech(text: str, voice_id: str, file_hash: str) -> str:
+    global file_count
+    file_count += 1
+    filename = f"{voice_id}_{file_hash}.mp3"
+    session_file_path = os.path.join(output_dir, filename)
+
+    # Convert text to speech
+    await asyncio.to_thread(synthesize_to_file, text, voice_id, session_file_path)
+
     # Cache the path for future use
     audio_cache[file_hash] = session_file_path
     
@@ -134,47 +168,48 @@ async def play_audio_file(file_path: str):
     # Run the play function in a separate thread
     await asyncio.get_running_loop().run_in_executor(executor, play, audio)
 
+def split_first_sentence(text: str) -> tuple[str, str]:
+    """Split text into its first sentence and the remainder (empty if there is only one sentence)."""
+    sentences = sent_tokenize(text)
+    if len(sentences) < 2:
+        return text, ""
+    return sentences[0], " ".join(sentences[1:])
+
 # Enqueue audio with error tracking
-async def enqueue_audio(text: str, connected_clients, voice_id: str = "pNInz6obpgDQGcFmaJgB"):
+async def enqueue_audio(text: str, broadcast, voice_id: str = "pNInz6obpgDQGcFmaJgB", previous: asyncio.Task = None):
     try:
-        # Generate the audio file
-        file_path = await text_to_speech_stream(text, voice_id=voice_id)
-        print(f"enqueue_audio!!! ===> Enqueued audio for text: '{text}' with voice_id: '{voice_id}'") # Debug info
-        await handle_audio_file(text, voice_id, file_path, connected_clients)
-
-        if False:
-            # Move file to static/audio directory with a unique name
-            file_name = f"{uuid.uuid4()}.mp3"  # Generate a unique name for each file
-            static_path = os.path.join("static/audio", file_name)
-            # copy2 instead of move to keep the original file
-            shutil.copy2(file_path, static_path)
-            #os.rename(file_path, static_path)
-
-            print(f"Copied audio file to: {static_path}")
-            
-            # Construct the URL for the client to access the audio file
-            audio_url = f"http://localhost:8000/static/audio/{file_name}"
-            print(f"Audio URL: {audio_url}")
-
-            # Send the audio URL to all connected WebSocket clients
-            for client in connected_clients:
-                print("sending audio URL to client.")
-                await client.send_text(f"AUDIO:{audio_url}")
-                print("Sent audio URL to client.")
-            #
-        #else:
-        #    print("!!! HOW DID WE GET HERE? !!!")
+        # Send the first sentence as its own clip so playback can start while the rest is synthesized
+        head, tail = split_first_sentence(text)
+        prefetch_speech(head, voice_id)
+        if tail:
+            prefetch_speech(tail, voice_id)
+
+        # Synthesis runs concurrently, but clips are sent in the order they were requested
+        if previous is not None:
+            await asyncio.wait([previous])
+
+        # Head and tail are sent back to back inside this request's turn, so no other clip lands between them
+        for part in (head, tail):
+            if not part:
+                continue
+            # Generate the audio file
+            file_path = await text_to_speech_stream(part, voice_id=voice_id)
+            print(f"enqueue_audio!!! ===> Enqueued audio for text: '{part}' with voice_id: '{voice_id}'") # Debug info
+            await handle_audio_file(part, voice_id, file_path, broadcast)
         #
 
+
     except Exception as e:
         logger.error(f"Error in enqueue audio for text: '{text}' with voice_id: '{voice_id}'. Exception: {e}")
         print(f"Error in enqueue audio for text: '{text}' with voice_id: '{voice_id}'. Exception: {e}")
     #
 #
 
-async def elevenlabs_tts(text: str, connected_clients, voice_id: str = "pNInz6obpgDQGcFmaJgB") -> None:
-    # Schedule enqueue audio as a background task with error tracking
-    task = asyncio.create_task(enqueue_audio(text, connected_clients, voice_id))
+async def elevenlabs_tts(text: str, broadcast, voice_id: str = "pNInz6obpgDQGcFmaJgB") -> None:
+    # Schedule enqueue audio as a background task with error tracking; it waits for the previous
+    # request (the last one still pending) to be sent before sending its own clips
+    previous = background_tasks[-1] if background_tasks else None
+    task = asyncio.create_task(enqueue_audio(text, broadcast, voice_id, previous))
     task.set_name(f"tts_task_{len(background_tasks) + 1}")
     task.add_done_callback(task_done_callback)  # Callback to remove task upon completion
     background_tasks.append(task)
@@ -241,40 +276,39 @@ def test_nltk_punkt():
         nltk.download('punkt')
         return False  # Download was necessary
 
+async def warm_tts_connection():
+    # A cheap authenticated request opens the client's pooled TLS connection before the first real synthesis
+    try:
+        await asyncio.to_thread(client.models.get_all)
+        print("ElevenLabs connection warmed up.")
+    except Exception as e:
+        print(f"ElevenLabs warm-up failed: {e}")
+
 # Main entry to start the playback worker
 async def tts_initialize():
+    asyncio.create_task(warm_tts_connection())  # Runs while punkt is checked and the game is set up
     test_nltk_punkt()
 
     # Start the playback worker
     # asyncio.create_task(playback_worker())
 #
 
-async def handle_audio_file(text:str, voice_id:str, file_path: str, connected_clients):
+async def handle_audio_file(text:str, voice_id:str, file_path: str, broadcast):
     print(f"Enqueuing audio for text: '{text}' with voice_id: '{voice_id}'")
 
-    file_path = await text_to_speech_stream(text, voice_id)
-    print(f"Generated audio file: {file_path}")
-
-    # Save file to static/audio directory with a unique name
-    file_name = f"{uuid.uuid4()}.mp3"
+    # Serve the clip under its (voice, text hash) name: a line that was already spoken is not copied again
+    file_name = f"{voice_id}_{generate_hash(text, voice_id)}.mp3"
     static_path = os.path.join("static/audio", file_name)
-    shutil.copy2(file_path, static_path)
-    print(f"Copied audio file to: {static_path}")
+    if not os.path.exists(static_path):
+        shutil.copy2(file_path, static_path)
+        print(f"Copied audio file to: {static_path}")
 
-    # Construct the accessible audio URL
-    audio_url = f"http://localhost:8000/static/audio/{file_name}"
+    # Relative URL, so the page fetches the clip from whichever host served it
+    audio_url = f"/static/audio/{file_name}"
     print(f"Audio URL: {audio_url}")
 
-    # Send the audio URL to all connected WebSocket clients
-    print(f"Connected clients: {connected_clients}")
-    for client in connected_clients:
-        try:
-            print("Sending audio URL to client.")
-            await client.send_text(f"AUDIO:{audio_url}")
-            print("Sent audio URL to client.")
-        except Exception as e:
-            print(f"Failed to send audio to client: {e}")
-            connected_clients.remove(client)  # Remove client on error
+    # Send the audio URL to the clients right away, outside the batched console output
+    broadcast({"t": "audio", "url": audio_url})
 
 
 
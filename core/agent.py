@@ -2,12 +2,15 @@
 import os
 import aiohttp
 from typing import Optional, Type, Union, List
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pydantic import BaseModel
 from openai import AsyncOpenAI
 import openai
 import json
-from time import sleep
+import re
+import hashlib
+import logging
 from enum import Enum, auto
 from dotenv import load_dotenv
 import aioconsole
@@ -25,6 +28,7 @@ from core.job_manager import (
     app
 )
 
+logger = logging.getLogger(__name__)
 
 @dataclass
 class Settings:
@@ -49,6 +53,15 @@ class ModelProvider(Enum):
     OPENAI = auto()
     OLLAMA = auto()
 
+# Providers that can return a Pydantic response_model
+STRUCTURED_OUTPUT_PROVIDERS = {ModelProvider.OPENAI}
+
+# Provider prefix used in 'provider|model_name' strings
+MODEL_PROVIDERS = {
+    'openai': ModelProvider.OPENAI,
+    'ollama': ModelProvider.OLLAMA,
+}
+
 class AgentError(Exception):
     """Base exception for agent-related errors"""
     pass
@@ -61,12 +74,53 @@ class ModelCallError(AgentError):
     """Raised when there's an error calling the model"""
     pass
 
-@dataclass
+# Seconds before a model call is abandoned (tasks can set their own deadline)
+MODEL_CALL_TIMEOUT = 120.0
+
+@lru_cache(maxsize=256)
+def parse_model_string(model_string: str) -> tuple[ModelProvider, str]:
+    """Parse a model string in the format 'provider|model_name'. Agents reuse a few strings, so results are cached."""
+    try:
+        provider, model_name = model_string.lower().split('|')
+        if provider not in MODEL_PROVIDERS:
+            raise ValueError(f"Unsupported provider: {provider}")
+        return MODEL_PROVIDERS[provider], model_name
+    except ValueError:
+        raise ValueError(f"Invalid model string format: {model_string}")
+
+# Responses of tasks that opt in (Task.cache) are kept here and replayed for identical requests
+llm_cache_file = "./llm_cache.json"
+
+def write_file_atomically(path: str, contents: str):
+    # Write to a temporary file and move it into place, so readers never see a partial file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(contents)
+    os.replace(tmp_path, path)
+
+TEMPLATE_INPUT_PATTERN = re.compile(r'\{(\w+)\}')
+
+@dataclass(frozen=True, slots=True)
 class Task:
     """Represents a specific task for an agent to perform"""
     description: str
     prompt_template: str
     response_model: Optional[Type[BaseModel]] = None
+    # Long-lived context (story so far, party roster...) sent as its own message ahead of the prompt,
+    # so successive calls share an identical prefix that providers can serve from their prompt cache
+    context_template: Optional[str] = None
+    # Per-task deadline, and for short calls that are cheap to repeat, the seconds after which a
+    # second identical request is sent if the first hasn't answered (None: never duplicate the call)
+    timeout: Optional[float] = MODEL_CALL_TIMEOUT
+    hedge_after: Optional[float] = None
+    # Reuse the stored response when the exact same request comes up again
+    cache: bool = False
+    required_inputs: tuple = field(init=False, repr=False)
+
+    def __post_init__(self):
+        # Templates are fixed, so work out their inputs once rather than on every call
+        templates = (self.context_template or "") + self.prompt_template
+        object.__setattr__(self, "required_inputs", tuple(dict.fromkeys(TEMPLATE_INPUT_PATTERN.findall(templates))))
 
     def format_prompt(self, **kwargs) -> str:
         try:
@@ -74,10 +128,17 @@ class Task:
         except KeyError as e:
             raise ValueError(f"Missing required input: {e}")
 
+    def format_context(self, **kwargs) -> Optional[str]:
+        if self.context_template is None:
+            return None
+        try:
+            return self.context_template.format(**kwargs)
+        except KeyError as e:
+            raise ValueError(f"Missing required input: {e}")
+
     def get_required_inputs(self) -> List[str]:
-        """Extract required input names from the prompt template."""
-        import re
-        return re.findall(r'\{(\w+)\}', self.prompt_template)
+        """Extract required input names from the prompt and context templates."""
+        return list(self.required_inputs)
 
 class ModelCaller:
     """Handles communication with different LLM providers"""
@@ -91,19 +152,56 @@ class ModelCaller:
             raise ConfigurationError("OPENAI_API_KEY not found in environment variables")
 
         self.client = AsyncOpenAI()  # Initialize the async client
+        self._ollama_session: Optional[aiohttp.ClientSession] = None  # Created on first Ollama call
+
+        # Load or initialize the response cache
+        if os.path.exists(llm_cache_file):
+            with open(llm_cache_file, "r") as f:
+                self.response_cache = json.load(f)
+        else:
+            self.response_cache = {}
+        self._cache_write_lock = asyncio.Lock()  # Keeps file writes in order
+
+        # Bound provider entry points, all taking (model, system_prompt, prompt, temperature, response_model, context)
+        self._provider_calls = {
+            ModelProvider.OPENAI: self._call_openai,
+            ModelProvider.OLLAMA: self._call_ollama,
+        }
+
+    def _get_ollama_session(self) -> aiohttp.ClientSession:
+        """Return the pooled session used for Ollama calls, so connections are kept alive between calls."""
+        if self._ollama_session is None or self._ollama_session.closed:
+            self._ollama_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=100, keepalive_timeout=30)
+            )
+        return self._ollama_session
+
+    async def prewarm(self):
+        """Open connections to the providers ahead of the first real call, so it doesn't pay the TLS handshake."""
+        try:
+            await self.client.models.list()
+        except Exception as e:
+            logger.warning(f"OpenAI prewarm failed: {e}")
+        try:
+            async with self._get_ollama_session().head(self.ollama_host):
+                pass
+        except Exception as e:
+            logger.warning(f"Ollama prewarm failed: {e}")
+
+    async def aclose(self):
+        """Close the pooled HTTP connections. A closed default caller is dropped, so the next
+        get_default_model_caller() builds a fresh one."""
+        global _default_model_caller
+        if _default_model_caller is self:
+            _default_model_caller = None
+        await self.client.close()
+        if self._ollama_session is not None:
+            await self._ollama_session.close()
+            self._ollama_session = None
 
     def parse_model_string(self, model_string: str) -> tuple[ModelProvider, str]:
         """Parse a model string in the format 'provider|model_name'."""
-        try:
-            provider, model_name = model_string.lower().split('|')
-            if provider == 'openai':
-                return ModelProvider.OPENAI, model_name
-            elif provider == 'ollama':
-                return ModelProvider.OLLAMA, model_name
-            else:
-                raise ValueError(f"Unsupported provider: {provider}")
-        except ValueError:
-            raise ValueError(f"Invalid model string format: {model_string}")
+        return parse_model_string(model_string)
 
     async def call_model(
         self,
@@ -112,37 +210,101 @@ class ModelCaller:
         prompt: str,
         temperature: float = 0.7,
         response_model: Optional[Type[BaseModel]] = None,
-        max_retries: int = 3
+        max_retries: int = 3,
+        context: Optional[str] = None,
+        timeout: Optional[float] = MODEL_CALL_TIMEOUT,
+        hedge_after: Optional[float] = None,
+        cache: bool = False
     ) -> Union[str, BaseModel]:
-        """Unified interface to call different model providers."""
+        """Unified interface to call different model providers.
+        With cache=True, an identical earlier request is answered from the response cache."""
         provider, model_name = self.parse_model_string(model_string)
 
+        if response_model and provider not in STRUCTURED_OUTPUT_PROVIDERS:
+            raise ModelCallError(
+                "Structured output using Pydantic models is not supported with Ollama models. "
+                "This feature is only available with OpenAI models."
+            )
+        provider_call = self._provider_calls[provider]
+        call = lambda: provider_call(
+            model_name,
+            system_prompt,
+            prompt,
+            temperature,
+            response_model,
+            context
+        )
+
+        cache_key = None
+        if cache:
+            cache_key = self.response_cache_key(model_string, system_prompt, prompt, temperature, response_model, context)
+            if cache_key in self.response_cache:
+                cached = self.response_cache[cache_key]
+                return response_model.model_validate_json(cached) if response_model else cached
+        #
+
         for attempt in range(max_retries):
             try:
-                if provider == ModelProvider.OPENAI:
-                    return await self._call_openai(
-                        model_name,
-                        system_prompt,
-                        prompt,
-                        temperature,
-                        response_model
-                    )
-                elif provider == ModelProvider.OLLAMA:
-                    if response_model:
-                        raise ModelCallError(
-                            "Structured output using Pydantic models is not supported with Ollama models. "
-                            "This feature is only available with OpenAI models."
-                        )
-                    return await self._call_ollama(
-                        model_name,
-                        system_prompt,
-                        prompt,
-                        temperature
-                    )
+                result = await self._call_hedged(call, timeout, hedge_after)
+                break
             except Exception as e:
                 if attempt == max_retries - 1:
                     raise ModelCallError(f"Failed after {max_retries} attempts: {str(e)}")
-                sleep(2 ** attempt)  # Exponential backoff
+                await asyncio.sleep(2 ** attempt)  # Exponential backoff
+
+        if cache_key is not None:
+            await self.store_response(cache_key, result.model_dump_json() if response_model else result)
+        return result
+
+    @staticmethod
+    def response_cache_key(model_string, system_prompt, prompt, temperature, response_model, context) -> str:
+        request = {
+            "model": model_string,
+            "system": system_prompt,
+            "context": context,
+            "prompt": prompt,
+            "temperature": temperature,
+            "response_model": response_model.__name__ if response_model else None,
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+    async def store_response(self, cache_key: str, response: str):
+        self.response_cache[cache_key] = response
+        contents = json.dumps(self.response_cache)
+        try:
+            async with self._cache_write_lock:
+                await asyncio.to_thread(write_file_atomically, llm_cache_file, contents)
+        except OSError as e:
+            logger.warning(f"Could not save the LLM response cache: {e}")
+
+    async def _call_hedged(self, call, timeout: Optional[float], hedge_after: Optional[float]):
+        """Run call(); if it is still pending after hedge_after seconds, start a second identical request
+        and keep whichever answers first. Gives up after timeout seconds."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        pending = {asyncio.create_task(call())}
+        try:
+            if hedge_after is not None and (timeout is None or hedge_after < timeout):
+                done, _ = await asyncio.wait(pending, timeout=hedge_after)
+                if not done:
+                    pending.add(asyncio.create_task(call()))
+            #
+
+            while True:
+                remaining = None if deadline is None else max(0, deadline - loop.time())
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError(f"Model call timed out after {timeout}s")
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    raise error
+            #
+        finally:
+            for task in pending:
+                task.cancel()
 
     # Adding detailed response validation
     async def _call_openai(
@@ -151,12 +313,14 @@ class ModelCaller:
         system_prompt: str,
         prompt: str,
         temperature: float,
-        response_model: Optional[Type[BaseModel]] = None) -> Union[str, BaseModel]:
+        response_model: Optional[Type[BaseModel]] = None,
+        context: Optional[str] = None) -> Union[str, BaseModel]:
 
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ]
+        messages = [{"role": "system", "content": system_prompt}]
+        if context:
+            # Keep the shared context in its own message so the prefix stays byte-identical across calls
+            messages.append({"role": "user", "content": context})
+        messages.append({"role": "user", "content": prompt})
 
         if response_model:
             # Use openai.pydantic_function_tool directly
@@ -169,7 +333,7 @@ class ModelCaller:
             )
             # Access the structured response within tool_calls
             arguments = completion.choices[0].message.tool_calls[0].function.arguments
-            return response_model.parse_raw(arguments)
+            return response_model.model_validate_json(arguments)
         else:
             # Call OpenAI normally without schema enforcement for unstructured text
             completion = await self.client.chat.completions.create(
@@ -185,10 +349,14 @@ class ModelCaller:
         model: str,
         system_prompt: str,
         prompt: str,
-        temperature: float
+        temperature: float,
+        response_model: None = None,
+        context: Optional[str] = None
     ) -> str:
-        """Internal method to call Ollama API."""
+        """Internal method to call Ollama API. Structured output is not supported (response_model must be None)."""
         headers = {"Content-Type": "application/json"}
+        if context:
+            prompt = f"{context}\n\n{prompt}"
         combined_prompt = f"System: {system_prompt}\n\nUser: {prompt}"
 
         data = {
@@ -197,15 +365,24 @@ class ModelCaller:
             "temperature": temperature
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.ollama_host}/api/generate",
-                headers=headers,
-                json=data
-            ) as response:
-                response.raise_for_status()
-                result = await response.json()
-                return result.get("response")
+        session = self._get_ollama_session()
+        async with session.post(
+            f"{self.ollama_host}/api/generate",
+            headers=headers,
+            json=data
+        ) as response:
+            response.raise_for_status()
+            result = await response.json()
+            return result.get("response")
+
+_default_model_caller: Optional[ModelCaller] = None
+
+def get_default_model_caller() -> ModelCaller:
+    """ModelCaller shared by all agents that don't bring their own, so they share one connection pool."""
+    global _default_model_caller
+    if _default_model_caller is None:
+        _default_model_caller = ModelCaller()
+    return _default_model_caller
 
 class Agent:
     """Base class for all agents"""
@@ -215,24 +392,31 @@ class Agent:
         system_prompt: str,
         model: str,
         temperature: float = 0.7,
-        model_caller: Optional[ModelCaller] = None
+        model_caller: Optional[ModelCaller] = None,
+        cache: Optional[bool] = None  # None: follow each task's cache setting
     ):
         self.name = name
         self.system_prompt = system_prompt
         self.model = model
         self.temperature = temperature
-        self.model_caller = model_caller or ModelCaller()
+        self.cache = cache
+        self._model_caller = model_caller
+
+    @property
+    def model_caller(self) -> ModelCaller:
+        # Looked up on each call, so agents pick up a new default caller after the old one is closed
+        return self._model_caller or get_default_model_caller()
 
     async def execute_task(self, task: Task, **kwargs) -> Union[str, BaseModel]:
         """Execute a task with the provided inputs"""
         # Validate inputs
-        required_inputs = task.get_required_inputs()
-        missing_inputs = [inp for inp in required_inputs if inp not in kwargs]
+        missing_inputs = [inp for inp in task.required_inputs if inp not in kwargs]
         if missing_inputs:
             raise ValueError(f"Missing required inputs: {missing_inputs}")
 
         # Format the prompt
         formatted_prompt = task.format_prompt(**kwargs)
+        formatted_context = task.format_context(**kwargs)
 
         # Check if the model is "human"
         #if self.model.lower() == "human":
@@ -247,7 +431,11 @@ class Agent:
             system_prompt=self.system_prompt,
             prompt=formatted_prompt,
             temperature=self.temperature,
-            response_model=task.response_model
+            response_model=task.response_model,
+            context=formatted_context,
+            timeout=task.timeout,
+            hedge_after=task.hedge_after,
+            cache=task.cache if self.cache is None else self.cache
         )
 
     def __repr__(self):
@@ -0,0 +1,21 @@
+# config.py
+import copy
+import os
+from functools import lru_cache
+import yaml
+
+# Use libyaml's C parser when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+@lru_cache(maxsize=8)
+def _load_yaml(path: str, mtime: float):
+    with open(path, "r") as f:
+        return yaml.load(f, Loader=YamlLoader)
+
+def load_yaml(path: str):
+    # Keyed on the modification time, so an unchanged file is only parsed once. Each caller gets its own
+    # copy, so changing the returned data (e.g. a character's sheet) can't alter the cached document
+    return copy.deepcopy(_load_yaml(path, os.path.getmtime(path)))
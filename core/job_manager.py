@@ -1,14 +1,18 @@
 # job_manager.py
 import asyncio
+import logging
 from concurrent.futures import ThreadPoolExecutor
 from PyQt5.QtWidgets import QInputDialog, QApplication
-from typing import Callable
+from typing import Callable, List
 import sys
 import uuid
 import os
 import shutil
 # ----------------------------------------------
-from audio.tts_elevenlabs import play_audio_file, text_to_speech_stream, handle_audio_file
+from audio.tts_elevenlabs import play_audio_file, elevenlabs_tts, prefetch_speech
+
+# Records from this logger reach the web console (see CONSOLE_LOGGERS in server.py)
+logger = logging.getLogger(__name__)
 
 user_input_event = asyncio.Event()
 user_input_value = "<nothing>"
@@ -22,26 +26,33 @@ audio_playback_queue = asyncio.Queue()
 tts_queue = asyncio.Queue()
 user_input_queue = asyncio.Queue()
 
+# Number of LLM jobs that may be in flight at once (e.g. party feedback is requested concurrently)
+LLM_WORKERS = 4
+
 # Define executors
 audio_executor = ThreadPoolExecutor(max_workers=2)  # Dedicated executor for audio
 main_thread_executor = ThreadPoolExecutor(max_workers=1)  # For GUI operations (e.g., user input)
 
 # Function to initialize all workers
-async def initialize_workers(clients):
-    asyncio.create_task(llm_worker())
+async def initialize_workers(broadcast):
+    for _ in range(LLM_WORKERS):
+        asyncio.create_task(llm_worker())
     asyncio.create_task(audio_playback_worker())
-    asyncio.create_task(tts_worker(clients))
+    asyncio.create_task(tts_worker(broadcast))
     asyncio.create_task(user_input_worker())
 
 # LLM Worker
 async def llm_worker():
     while True:
-        agent, job, kwargs, result_list = await llm_queue.get()
+        agent, job, kwargs, result_future = await llm_queue.get()
         try:
             result = await agent.execute_task(job, **kwargs)
-            result_list.append(result)
+            if not result_future.done():
+                result_future.set_result(result)
         except Exception as e:
-            print(f"Error in LLM Worker: {e}")
+            logger.error(f"Error in LLM Worker: {e}")
+            if not result_future.done():
+                result_future.set_result(None)
         finally:
             llm_queue.task_done()
 
@@ -60,38 +71,14 @@ async def audio_playback_worker():
         await asyncio.sleep(1)
 
 # TTS Worker
-async def tts_worker(connected_clients):
+async def tts_worker(broadcast):
     while True:
         text, voice_id = await tts_queue.get()
         try:
             print(f"TTSWORKER<<<<: Enqueuing audio for text: '{text}' with voice_id: '{voice_id}'")
 
-            file_path = await text_to_speech_stream(text, voice_id)
-            print(f"TTSWORKER<<<< Generated audio file: {file_path}")
-            await handle_audio_file(text, voice_id, file_path, connected_clients)
-            print("TTSWORKER<<<< Audio file handled.")
-
-            if False:
-                # Save file to static/audio directory with a unique name
-                file_name = f"{uuid.uuid4()}.mp3"
-                static_path = os.path.join("static/audio", file_name)
-                shutil.copy2(file_path, static_path)
-                print(f"Copied audio file to: {static_path}")
-
-                # Construct the accessible audio URL
-                audio_url = f"http://localhost:8000/static/audio/{file_name}"
-                print(f"Audio URL: {audio_url}")
-
-                # Send the audio URL to all connected WebSocket clients
-                for client in connected_clients:
-                    try:
-                        print("Sending audio URL to client.")
-                        await client.send_text(f"AUDIO:{audio_url}")
-                        print("Sent audio URL to client.")
-                    except Exception as e:
-                        print(f"Failed to send audio to client: {e}")
-                        connected_clients.remove(client)  # Remove client on error
-            #
+            # Same chain as the narration clips, so queued clips and narration reach the clients in call order
+            await elevenlabs_tts(text, broadcast, voice_id)
 
         except Exception as e:
             print(f"Error in TTS Worker: {e}")
@@ -123,17 +110,16 @@ async def enqueue_llm_job(agent, job, **kwargs):
         return human_generated_text
     #
 
-    result_list = []
-    await llm_queue.put((agent, job, kwargs, result_list))
-    await llm_queue.join()  # Wait until job is processed
+    # Each job gets its own future, so the caller waits for this job only, not for the whole queue
+    result_future = asyncio.get_running_loop().create_future()
+    await llm_queue.put((agent, job, kwargs, result_future))
+    result = await result_future
+    logger.debug("Result: %s", result)
 
-    print("Result list: ", result_list)
-
-    if result_list==None or len(result_list)==0:
-        print("ERROR: No result list for agent=", agent, " job=", job, kwargs)
-        return None
+    if result is None:
+        logger.error(f"No result for agent={agent} job={job} {kwargs}")
     #
-    return result_list[0]
+    return result
 
 async def enqueue_audio_playback_job(file_path: str):
     await audio_playback_queue.put(file_path)
@@ -141,6 +127,12 @@ async def enqueue_audio_playback_job(file_path: str):
 async def enqueue_tts_job(text: str, voice_id: str):
     await tts_queue.put((text, voice_id))
 
+async def enqueue_tts_batch(texts: List[str], voice_id: str):
+    # Synthesize all the clips at once; they are still sent to the clients in order
+    for text in texts:
+        prefetch_speech(text, voice_id)
+        await tts_queue.put((text, voice_id))
+
 async def enqueue_user_input_job(received_value: str):
     global user_input_event, user_input_value
     user_input_value=received_value
@@ -150,7 +142,7 @@ async def enqueue_user_input_job(received_value: str):
 
 async def get_user_input(prompt):
     global user_input_event, user_input_value
-    print(prompt)
+    logger.info(prompt)  # Shown in the web console, where the player types the answer
     user_input_event.clear()  # Reset the event
     await user_input_event.wait()  # Wait until input is received
     return user_input_value  # Return the stored input
@@ -65,6 +65,15 @@ summarize_turn = Task(
 
 summarize_round = Task(
     description="Create a comprehensive summary of the completed round",
+    context_template="""
+    <party_members>
+        {party_members}
+    </party_members>
+
+    <previous_summary>
+        {previous_summary}
+    </previous_summary>
+    """,
     prompt_template="""
     <round_summary>
         <round_number>{round_number}</round_number>
@@ -77,14 +86,6 @@ summarize_round = Task(
             {round_events}
         </round_events>
 
-        <party_members>
-            {party_members}
-        </party_members>
-
-        <previous_summary>
-            {previous_summary}
-        </previous_summary>
-
         <summary_guidelines>
             - Use initial_situation to frame the context at the start of the round.
             - Use round_events to highlight important actions and their impacts.
@@ -153,6 +154,11 @@ retrieve_relevant_context = Task(
 
 task__ask_questions = Task(
     description="Ask relevant questions to the Dungeon Master about the current situation",
+    context_template="""
+    <story_so_far>
+    {the_story_so_far}
+    </story_so_far>
+    """,
     prompt_template="""
     <ask_questions>
         <character_name>{character_name}</character_name>
@@ -161,10 +167,6 @@ task__ask_questions = Task(
             It is your turn. Before you act, ask relevant questions to the Dungeon Master about the current situation.
         </turn_instructions>
 
-        <story_so_far>
-            {the_story_so_far}
-        </story_so_far>
-
         <dm_info>
             {what_the_dm_just_told_you}
         </dm_info>
@@ -191,6 +193,11 @@ task__ask_questions = Task(
 
 task__declare_intent = Task(
     description="Declare your intended action based on the information gathered",
+    context_template="""
+    <story_so_far>
+    {the_story_so_far}
+    </story_so_far>
+    """,
     prompt_template="""
     <declare_intent>
         <character_name>{character_name}</character_name>
@@ -199,10 +206,6 @@ task__declare_intent = Task(
             It is your turn. You have just asked a few questions to the DM and received your answers. Now declare what action you're considering taking and why.
         </turn_instructions>
 
-        <story_so_far>
-            {the_story_so_far}
-        </story_so_far>
-
         <dm_response>
             {what_the_dm_just_told_you}
         </dm_response>
@@ -236,6 +239,11 @@ task__declare_intent = Task(
 
 task__provide_feedback = Task(
     description="Give feedback to another character's intended action",
+    context_template="""
+    <story_so_far>
+    {the_story_so_far}
+    </story_so_far>
+    """,
     prompt_template="""
     <provide_feedback>
         <other_character_name>{other_character_name}</other_character_name>
@@ -244,10 +252,6 @@ task__provide_feedback = Task(
             It is your turn to provide quick feedback regarding another character's intended action, as if you were talking to them in-character.
         </turn_instructions>
 
-        <story_so_far>
-            {the_story_so_far}
-        </story_so_far>
-
         <dm_info>
             {what_the_dm_just_told_you}
         </dm_info>
@@ -276,11 +280,13 @@ task__provide_feedback = Task(
 
 task__make_decision = Task(
     description="Make your final decision on what you will attempt, considering party feedback",
+    context_template="""
+    The story so far: 
+    {the_story_so_far}
+    """,
     prompt_template="""
     {character_name}, it is your turn. You have proposed an action and received feedback from your party. Now make your final decision on what you will attempt.
 
-    The story so far: 
-    {the_story_so_far}
     {what_the_dm_just_told_you}
 
     Your original proposal:
@@ -305,14 +311,15 @@ task__make_decision = Task(
 
 task__describe_initial_situation_chatty = Task(
     description="Describe the current situation to the player",
+    context_template="""
+    The story so far: 
+    {the_story_so_far}
+    """,
     prompt_template="""
     This is the beginning of {character_name} turn. 
     Progress the story as needed based on what transpire before and describe the situation to {character_name} so they can make their choice.
     Do not be too verbose, the players want to play! Do provide enough information to help them make an informed decision.
     Not need to provide a list of choices to the player: let them decide what they want to do.
-
-    The story so far: 
-    {the_story_so_far}
     
     {character_name}'s details: {character_sheet}
     Other party members: {other_characters}
@@ -330,6 +337,11 @@ task__describe_initial_situation_chatty = Task(
 
 task__describe_initial_situation = Task(
     description="Describe the current situation to the player briefly",
+    context_template="""
+    <story_so_far>
+    {the_story_so_far}
+    </story_so_far>
+    """,
     prompt_template="""
     <describe_initial_situation>
         <character_name>{character_name}</character_name>
@@ -338,10 +350,6 @@ task__describe_initial_situation = Task(
             Provide a succinct description to set up {character_name}'s next turn. Use minimal detail—focus only on key elements that affect immediate decisions.
         </turn_instructions>
 
-        <story_so_far>
-            {the_story_so_far}
-        </story_so_far>
-
         <character_sheet>
             {character_sheet}
         </character_sheet>
@@ -360,16 +368,17 @@ task__describe_initial_situation = Task(
 
 task__describe_situation = Task(
     description="Describe the current situation to the player in a few lines",
+    context_template="""
+    <the_story_so_far>
+    {the_story_so_far}
+    </the_story_so_far>
+    """,
     prompt_template="""
     This is the beginning of {character_name} turn. Your job is to describe the current situation to the player as succinctly as possible.
     Progress the story as needed based on what transpire before and describe the situation to {character_name} so they can make their choice.
     Be succint, the players want to play! Do provide enough information to help them make an informed decision.
     Not need to provide a list of choices to the player: let them decide what they want to do.
 
-    <the_story_so_far>
-    {the_story_so_far}
-    </the_story_so_far>
-
     Do not repeat decriptions or facts that appear in the story_so_far since it is fresh in the player's mind.
     
     <{character_name}>
@@ -399,14 +408,15 @@ class DifficultyAssessment(BaseModel):
 
 task__assess_difficulty = Task(
     description="Assess the difficulty of a character's proposed action",
+    context_template="""
+    <story_so_far>
+    {the_story_so_far}
+    </story_so_far>
+    """,
     prompt_template="""
     <difficulty_assessment>
         <character_name>{character_name}</character_name>
 
-        <story_so_far>
-            {the_story_so_far}
-        </story_so_far>
-
         <dm_response>
             {what_you_just_told_the_player}
         </dm_response>
@@ -424,20 +434,24 @@ task__assess_difficulty = Task(
         </assessment_guidelines>
     </difficulty_assessment>
     """,
-    response_model=DifficultyAssessment
+    response_model=DifficultyAssessment,
+    # A short JSON verdict: worth a duplicate request if the first one stalls
+    timeout=30.0,
+    hedge_after=10.0
 )
 
 
 task__answer_questions = Task(
     description="Answer the character's questions based on the game's progress",
+    context_template="""
+    <story_so_far>
+    {the_story_so_far}
+    </story_so_far>
+    """,
     prompt_template="""
     <answer_questions>
         <character_name>{character_name}</character_name>
 
-        <story_so_far>
-            {the_story_so_far}
-        </story_so_far>
-
         <dm_response>
             {what_you_just_told_the_player}
         </dm_response>
@@ -459,14 +473,15 @@ task__answer_questions = Task(
 
 task__resolve_action_chatty = Task(
     description="Resolve the character's action based on the roll result",
+    context_template="""
+    <story_so_far>
+    {the_story_so_far}
+    </story_so_far>
+    """,
     prompt_template="""
     <resolve_action>
         <character_name>{character_name}</character_name>
 
-        <story_so_far>
-            {the_story_so_far}
-        </story_so_far>
-
         <dm_response>
             {what_you_just_told_the_player}
         </dm_response>
@@ -492,14 +507,15 @@ task__resolve_action_chatty = Task(
 
 task__resolve_action = Task(
     description="Resolve the character's action briefly based on the roll result",
+    context_template="""
+    <story_so_far>
+    {the_story_so_far}
+    </story_so_far>
+    """,
     prompt_template="""
     <resolve_action>
         <character_name>{character_name}</character_name>
 
-        <story_so_far>
-            {the_story_so_far}
-        </story_so_far>
-
         <dm_response>
             {what_you_just_told_the_player}
         </dm_response>
@@ -689,7 +705,8 @@ task__enforce_dm = Task(
         Ideally, you will output the same text as you reviewed. However, if violations are found, 
         revise the output to remove the violations while keeping the narrative flow intact.
         """,
-    response_model=None  # Can use a model for structured validation if needed
+    response_model=None,  # Can use a model for structured validation if needed
+    cache=True  # The same text always gets the same edit
 )
 
 # Define the task for enforcing Player behavior
@@ -709,5 +726,6 @@ task__enforce_player = Task(
 
         Ideally, you will output the same text as you reviewed. However, if any issues are detected, revise the output to retain the player’s perspective while removing control over outcomes and other characters.
         """,
-    response_model=None
+    response_model=None,
+    cache=True  # The same text always gets the same edit
 )
@@ -2,8 +2,10 @@
 # ----------------------------------------------
 from typing import List, Dict, Any
 from dataclasses import dataclass
+from functools import cached_property
 from pydantic import BaseModel
 from random import Random
+import asyncio
 import difflib
 import uuid
 # ----------------------------------------------
@@ -31,22 +33,23 @@ SKIP = False
 TTS_MODEL = "ELEVENSLAB"
 logger = None
 
-async def tts(text: str, connected_clients, voice_id: str = "pNInz6obpgDQGcFmaJgB") -> None:
+async def tts(text: str, broadcast, voice_id: str = "pNInz6obpgDQGcFmaJgB") -> None:
     # ELEVENSLAB TTS
     if TTS_MODEL == "ELEVENSLAB":
         # Schedule enqueue audio to run as a background task
-        await elevenlabs_tts(text, connected_clients, voice_id)
+        await elevenlabs_tts(text, broadcast, voice_id)
 
 
 async def enforce_dm(enforcer_agent, original_text:str, logger) -> str:
 
-    logger.info("DM[*]:")
     edited_text = await enqueue_llm_job(
                 enforcer_agent,
                 task__enforce_dm,
                 dm_output=original_text
             )
 
+    logger.info("DM[*]:")
+
     color_diff(original_text, edited_text, logger)
 
     return edited_text
@@ -54,13 +57,14 @@ async def enforce_dm(enforcer_agent, original_text:str, logger) -> str:
 
 async def enforce_player(enforcer_agent, original_text:str, player_name, logger) -> str:
     
-    logger.info(f"{player_name.upper()}[*]:")        
     edited_text = await enqueue_llm_job(
                 enforcer_agent,
                 task__enforce_player,
                 player_output=original_text
             )
 
+    logger.info(f"{player_name.upper()}[*]:")        
+
     color_diff(original_text, edited_text, logger)
 
     return edited_text
@@ -123,9 +127,14 @@ class CharacterSheet:
     flaws: List[str]
     quirks: List[str]
 
-    def to_string(self) -> str:
+    # Sheets are not edited once the game starts; if a field is changed, `del sheet.as_string` to re-render
+    @cached_property
+    def as_string(self) -> str:
         return f"Character Name: {self.name}, Pronoums: {self.pronouns}, Class: {self.class_name}, Level: {self.level}, Race: {self.race}, Abilities: {', '.join(self.key_abilities)}, Equipment: {', '.join(self.equipment)}, Description: {self.description}, Traits: {', '.join(self.traits)}, Ideals: {', '.join(self.ideals)}, Bonds: {', '.join(self.bonds)}, Flaws: {', '.join(self.flaws)}, Quirks: {', '.join(self.quirks)}"
 
+    def to_string(self) -> str:
+        return self.as_string
+
 @dataclass
 class PlayerCharacter:
     character_name: str
@@ -135,7 +144,7 @@ class PlayerCharacter:
 
     def __init__(self, name: str, character_sheet: CharacterSheet, character_voice: str = "pNInz6obpgDQGcFmaJgB", character_model: str = DEFAULT_PLAYERS_MODEL):
    
-        PLAYER_SYSTEM_PROMPT = f"You are playing {name}, a character in a D&D game. This is a brief description of your character: {character_sheet.to_string()}."""
+        PLAYER_SYSTEM_PROMPT = f"You are playing {name}, a character in a D&D game. This is a brief description of your character: {character_sheet.as_string}."""
 
         self.character_name = name
         self.character_sheet = character_sheet
@@ -167,25 +176,36 @@ class GameMaster:
             last_actions={} )
 
         self.very_first_time = True
+
+        # The party roster does not change during a game, so work out "everyone but X" once per player
+        self.other_players = {
+            character.character_name: tuple(
+                other for other in player_characters
+                if other.character_name != character.character_name
+            )
+            for character in player_characters
+        }
+        self.other_characters_descriptions = {
+            name: "".join(other.character_sheet.as_string + "\n" for other in others)
+            for name, others in self.other_players.items()
+        }
     #
 
     
-    async def execute_player_turn(self, player: PlayerCharacter, the_story_so_far:str, console_logger, connected_clients) -> None:
+    async def execute_player_turn(self, player: PlayerCharacter, the_story_so_far:str, console_logger, broadcast) -> None:
         
         logger = console_logger
-        print("LOGGER = %s", logger)
 
-        this_turn_narrative = the_story_so_far +"\n"
+        # Collect the turn in pieces and join once at the end: the story so far can get long
+        this_turn_narrative = [the_story_so_far, "\n"]
 
         character_name = player.character_name
-        character_sheet = player.character_sheet.to_string()
+        character_sheet = player.character_sheet.as_string
         agent__player = player.character_agent
         character_voice = player.character_voice
         is_human = agent__player.model.lower() == "human"
         
-        context = self.state.get_relevant_context()
         other_characters = self._format_other_characters(character_name)
-        situation = self.state.current_situation
 
         logger.info(f"\n=== {character_name}'s Turn ===")
 
@@ -203,23 +223,19 @@ class GameMaster:
                     other_characters=other_characters,
                 )
                 generated__situation_description = await enforce_dm(self.agent__enforcer, generated__situation_description, logger)
-                await tts(generated__situation_description, connected_clients, self.dm_voice)
+                await tts(generated__situation_description, broadcast, self.dm_voice)
             #
 
 
             new_narrative = f"\nDM:\n{generated__situation_description}\n"
             #logger.info(new_narrative)
-            this_turn_narrative += new_narrative
+            this_turn_narrative.append(new_narrative)
             self.very_first_time = False
 
             try:
                 logger.info("\n# 2. Player asks questions\n")
-                # let's list the clients
-                for client in connected_clients:
-                    print(f"Client: {client}")
-                #   
                             
-                if VERBOSE: await tts(f"{character_name}, do you have any questions?", connected_clients, self.dm_voice)
+                if VERBOSE: await tts(f"{character_name}, do you have any questions?", broadcast, self.dm_voice)
 
                 generated__questions = ""
                 if False: #is_human:
@@ -236,10 +252,10 @@ class GameMaster:
                         )
                 
                 new_narrative = f"\n{character_name.upper()}:\n{generated__questions}\n"
-                if VERBOSE: await tts(generated__questions, connected_clients, character_voice)
+                if VERBOSE: await tts(generated__questions, broadcast, character_voice)
 
                 logger.info(new_narrative)
-                this_turn_narrative += new_narrative
+                this_turn_narrative.append(new_narrative)
             except Exception as e:
                 logger.info(f"Error during {character_name}'s question asking: {str(e)}")
                 # halt the game here
@@ -260,11 +276,11 @@ class GameMaster:
                 )
 
                 generated__answers = await enforce_dm(self.agent__enforcer, generated__answers, logger)
-                if VERBOSE: await tts(generated__answers, connected_clients, self.dm_voice)
+                if VERBOSE: await tts(generated__answers, broadcast, self.dm_voice)
 
                 new_narrative = f"\nDM:\n{generated__answers}\n"
                 #logger.info(new_narrative)
-                this_turn_narrative += new_narrative
+                this_turn_narrative.append(new_narrative)
             except Exception as e:
                 logger.info(f"Error during {character_name}'s question answering: {str(e)}")
                 # halt the game here
@@ -283,44 +299,55 @@ class GameMaster:
                 player_questions = generated__questions,
                 dm_answers = generated__answers,
             )
-            await tts(generated__intent, connected_clients, character_voice)
+            await tts(generated__intent, broadcast, character_voice)
             new_narrative = f"\n{character_name.upper()}:\n{generated__intent}\n"
             logger.info(new_narrative)
-            this_turn_narrative += new_narrative
+            this_turn_narrative.append(new_narrative)
 
             logger.info("\n# 5. Other players provide feedback\n")
+            async def get_feedback(other_player: PlayerCharacter) -> str:
+                generated__player_feedback = await enqueue_llm_job(
+                    other_player.character_agent,
+                    task__provide_feedback,
+
+                    other_character_name = other_player.character_name,
+                    the_story_so_far = the_story_so_far,
+                    what_the_dm_just_told_you = generated__situation_description,
+                    other_character_sheet = other_player.character_sheet.as_string,
+                    acting_character_name = character_name,
+                    intended_action = generated__intent
+                )
+                return await enforce_player(self.agent__enforcer, generated__player_feedback, other_player.character_name, logger)
+            #
+
+            # Feedback from AI players is independent, so ask them all at once.
+            # Human players share a single input prompt and are still asked one at a time.
+            other_players = self.other_players[character_name]
+            ai_players = [p for p in other_players if p.character_agent.model.lower() != "human"]
+            feedback_by_name = dict(zip(
+                (p.character_name for p in ai_players),
+                await asyncio.gather(*(get_feedback(p) for p in ai_players))
+            ))
+            for other_player in other_players:
+                if other_player.character_name not in feedback_by_name:
+                    feedback_by_name[other_player.character_name] = await get_feedback(other_player)
+            #
+
             generated__feedbacks = []
-            for other_player in self.player_characters:
+            for other_player in other_players:
                 other_name = other_player.character_name
                 other_voice = other_player.character_voice
-                other_agent = other_player.character_agent
-                other_sheet = other_player.character_sheet.to_string()
-
-
-                if other_name != character_name:
+                generated__player_feedback = feedback_by_name[other_name]
 
-                    logger.info(f"\n...")
-                    await tts(f"{other_name}?", connected_clients, character_voice)
-                    generated__player_feedback = await enqueue_llm_job(
-                        other_agent,
-                        task__provide_feedback,
+                logger.info(f"\n...")
+                await tts(f"{other_name}?", broadcast, character_voice)
+                await tts(generated__player_feedback, broadcast, other_voice)
 
-                        other_character_name=other_name,
-                        the_story_so_far = the_story_so_far,
-                        what_the_dm_just_told_you = generated__situation_description,
-                        other_character_sheet = other_sheet,
-                        acting_character_name = character_name,
-                        intended_action = generated__intent
-                    )
+                generated__feedbacks.append((other_name, generated__player_feedback))
 
-                    generated__player_feedback = await enforce_player(self.agent__enforcer, generated__player_feedback, other_name, logger)
-                    await tts(generated__player_feedback, connected_clients, other_voice)
-
-                    generated__feedbacks.append((other_name, generated__player_feedback))
-
-                    new_narrative = f"\n\n{other_name.upper()}:\n{generated__player_feedback}\n\n"
-                    #logger.info(new_narrative)
-                    this_turn_narrative += new_narrative
+                new_narrative = f"\n\n{other_name.upper()}:\n{generated__player_feedback}\n\n"
+                #logger.info(new_narrative)
+                this_turn_narrative.append(new_narrative)
 
             logger.info("\n# 6. Player makes final decision\n")
             generated__final_action = await enqueue_llm_job(
@@ -336,11 +363,11 @@ class GameMaster:
             )
 
             generated__final_action = await enforce_player(self.agent__enforcer, generated__final_action, character_name, logger)
-            await tts(generated__final_action, connected_clients, character_voice)
+            await tts(generated__final_action, broadcast, character_voice)
 
             new_narrative = f"\n{character_name.upper()}:\n{generated__final_action}\n"
             #logger.info(new_narrative)
-            this_turn_narrative += new_narrative
+            this_turn_narrative.append(new_narrative)
 
             logger.info("\n# 7. DM assesses difficulty\n")
             generated__difficulty_assessment:DifficultyAssessment = await enqueue_llm_job(
@@ -356,7 +383,7 @@ class GameMaster:
             
             new_narrative = f"\nDM:\nDifficulty: {generated__difficulty_assessment.difficulty}\nReasoning: {generated__difficulty_assessment.reasoning}\n"
             logger.info(new_narrative)
-            this_turn_narrative += new_narrative
+            this_turn_narrative.append(new_narrative)
 
             logger.info("\n# 8. Resolve action\n")
             difficulty_thresholds = {"auto_succeed": 100, "easy": 80, "average": 60, "hard": 40, "super_hard": 20, "auto_fail":0}.get
@@ -366,7 +393,7 @@ class GameMaster:
 
             new_narrative = f"\nRoll is {roll}. Threshold was {success_threshold}\n"
             logger.info(new_narrative)
-            this_turn_narrative += new_narrative
+            this_turn_narrative.append(new_narrative)
 
             if did_roll_succeed: 
                 new_narrative = f"\n{character_name} succeeds!\n" 
@@ -374,9 +401,9 @@ class GameMaster:
                 new_narrative = f"\n{character_name} fails!\n"
             #
             logger.info(new_narrative)
-            await tts(new_narrative, connected_clients, self.dm_voice)
+            await tts(new_narrative, broadcast, self.dm_voice)
 
-            this_turn_narrative += new_narrative
+            this_turn_narrative.append(new_narrative)
 
             generated__resolution = await enqueue_llm_job(
                 self.agent__dm,
@@ -394,34 +421,26 @@ class GameMaster:
             )
 
             generated__resolution = await enforce_dm(self.agent__enforcer, generated__resolution, logger)
-            await tts(generated__resolution, connected_clients, self.dm_voice)
+            await tts(generated__resolution, broadcast, self.dm_voice)
 
             new_narrative = f"\n{generated__resolution}\n"
             #logger.info(new_narrative)
-            this_turn_narrative += new_narrative
+            this_turn_narrative.append(new_narrative)
 
             # Update game state
             #self.state.last_actions[character_name] = generated__final_action
             #self.state.round_summaries.append(f"{character_name}'s Action:\n- Attempted: {generated__final_action}\n- Result: {generated__resolution}")
 
-            return this_turn_narrative
+            return "".join(this_turn_narrative)
         
         except Exception as e:
             logger.info(f"Error during {character_name}'s turn: {str(e)}")
             # halt the game here
             raise e
 
-        return this_turn_narrative
+        return "".join(this_turn_narrative)
     #
 
     def _format_other_characters(self, active_player_name: str) -> str:
-
-        other_characters_description = ""
-        for character in self.player_characters:
-            if character.character_name != active_player_name:
-                other_characters_description += character.character_sheet.to_string() + "\n"
-            #
-        #
-
-        return other_characters_description
+        return self.other_characters_descriptions[active_player_name]
     #
\ No newline at end of file
@@ -2,158 +2,115 @@
 # ----------------------------------------------
 import asyncio
 import argparse
+import os
 import sys
 from qasync import QEventLoop
 from PyQt5.QtWidgets import QInputDialog, QApplication
 import logging
+from nltk.tokenize import sent_tokenize
 # ----------------------------------------------
 from dnd.dnd_agents import Agent, player_agent, chronicler_agent, dm_agent, enforcer_agent, less_chatty_dm
 from dnd.game_master import GameMaster, PlayerCharacter, CharacterSheet
+from core.agent import get_default_model_caller
+from core.config import load_yaml
 from audio.tts_elevenlabs import tts_initialize, flush_audio_queue, playback_worker, audio_queue
 from core.job_manager import (
     initialize_workers,
     enqueue_llm_job,
     enqueue_audio_playback_job,
     enqueue_tts_job,
+    enqueue_tts_batch,
     enqueue_user_input_job,
     get_user_input,
     app
 )
 # ----------------------------------------------
 
-DM_VOICE = "N2lVS1w4EtoT3dr4eOWO" # Callum's voice
-SKIP_INTRO = False
+DM_VOICE = os.getenv("DM_VOICE", "N2lVS1w4EtoT3dr4eOWO") # Callum's voice by default
+SKIP_INTRO = os.getenv("SKIP_INTRO", "0").lower() in ("1", "true", "yes")
 logger =  None
+# ----------------------------------------------
+CHARACTERS_FILE = "characters.yaml"
+
+def create_player_characters() -> list[PlayerCharacter]:
+    # The party is read from characters.yaml (parsed once per process, see core.config.load_yaml)
+    return [
+        PlayerCharacter(**{**player, "character_sheet": CharacterSheet(**player["character_sheet"])})
+        for player in load_yaml(CHARACTERS_FILE)
+    ]
+#
+
 # ----------------------------------------------
 # Example of running the game
-async def main(initial_situation, connected_clients, console_logger):
+async def main(initial_situation, broadcast, console_logger):
 
     logger = console_logger
-    logger.info("LOGGER = %s", logger)
 
     logger.info("MAIN")
     logger.info("Starting the game...")
+
+    prewarm_task = None
     try:
         logger.info("Inializing workers..")
-        await initialize_workers(connected_clients)  # Initialize all job workers
+        await initialize_workers(broadcast)  # Initialize all job workers
+        prewarm_task = asyncio.create_task(get_default_model_caller().prewarm())  # Warm up LLM connections in the background
 
 
         await tts_initialize()
 
-        # Start playback worker task within active event loop
-        playback_task = asyncio.create_task(playback_worker())
-
-        logger.info("Enqueuing user input job..")
-        user_input = await get_user_input("What is the name of the DM?")
-        logger.info(f"User input: {user_input}")
-
-        # Create player agents -------------------------------------------
-
-        # Create Brussae the Paladin
-        brussae = PlayerCharacter(
-            character_model="human",
-            name="Brussae", 
-            character_sheet=CharacterSheet(
-                name="Brussae",
-                pronouns="he/him",
-                level=2,
-                class_name="Paladin",
-                race="Human",
-                key_abilities=["divine magic", "combat", "healing"],
-                equipment=["longsword", "shield", "chain mail"],
-                description="A warrior of faith, devoted to protecting the innocent",
-                traits=["brave", "compassionate", "direct"],
-                ideals=["protect the innocent", "uphold justice"],
-                bonds=["sworn to defend the weak", "devoted to their deity"],
-                flaws=["too trusting", "sees everything as good vs evil"],
-                quirks=["always cleans their sword after battle", "prays before every meal"]
-            ),
-            character_voice="iP95p4xoKVk53GoZ742B" #Chris	
-        )
-
-        # Create Shadowstep the Rogue
-        shadowstep = PlayerCharacter(
-            name = "Shadowstep",
-            character_sheet=CharacterSheet(
-                name="Shadowstep",
-                pronouns="he/him",
-                level=3,
-                class_name="Rogue",
-                race="Elf",
-                key_abilities=["stealth", "lockpicking", "acrobatics"],
-                equipment=["daggers", "thieves tools", "leather armor"],
-                description="A nimble burglar with a heart of gold",
-                traits=["cunning", "cautious", "witty"],
-                ideals=["freedom", "loyalty to friends"],
-                bonds=["protective of street urchins", "owes a debt to a noble"],
-                flaws=["greedy", "overconfident in their abilities"],
-                quirks=["always checks for traps, even in safe places", "collects small trinkets"]
-            ),
-            character_voice="JBFqnCBsd6RMkjVDRZzb" # George
-        )
-
-        # Create Eldara the Wizard
-        eldara = PlayerCharacter(
-            name="Eldara", 
-            character_sheet= CharacterSheet(
-                name="Eldara",
-                pronouns="she/her",
-                level=2,
-                class_name="Wizard",
-                race="half-elf",
-                key_abilities=["arcane magic", "investigation", "history"],
-                equipment=["staff", "spellbook", "component pouch"],
-                description="A scholarly mage seeking ancient knowledge",
-                traits=["analytical", "curious", "reserved"],
-                ideals=["knowledge", "magical preservation"],
-                bonds=["ancient magical texts", "wizard academy"],
-                flaws=["overthinks simple problems", "dismissive of non-magical solutions"],
-                quirks=["takes notes about everything", "speaks in unnecessarily complex terms"]
-            ),
-            character_voice="Xb7hH8MSUJpSbSDYk0k2" # Alice
-        )
-
-        player_characters = [brussae, shadowstep, eldara]
-
-        game_master = GameMaster(
-            dm_agent=less_chatty_dm,
-            player_characters=player_characters,
-            chronicler_agent=chronicler_agent,
-            enforcer_agent=enforcer_agent,
-            initial_situation=initial_situation,
-            dm_voice=DM_VOICE
-        )
-        
-        if SKIP_INTRO==False: await enqueue_tts_job("Welcome to the game! I am the Dungeon Master. Let's begin.", DM_VOICE)
-        #if SKIP_INTRO==False: await enqueue_tts_job(initial_situation, DM_VOICE)
-
-        logger.info("Starting the game... v 0.22 \n--------------------\n")
-        logger.info(initial_situation)
-        logger.info("---------")
-
-        if True:
+        # The task group joins the playback worker on the way out, or cancels it if the game fails
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(playback_worker())
+
+            logger.info("Enqueuing user input job..")
+            user_input = await get_user_input("What is the name of the DM?")
+            logger.info(f"User input: {user_input}")
+
+            # Create player agents -------------------------------------------
+            player_characters = create_player_characters()
+
+            game_master = GameMaster(
+                dm_agent=less_chatty_dm,
+                player_characters=player_characters,
+                chronicler_agent=chronicler_agent,
+                enforcer_agent=enforcer_agent,
+                initial_situation=initial_situation,
+                dm_voice=DM_VOICE
+            )
+            
+            if SKIP_INTRO==False:
+                # One clip per sentence, synthesized together, so narration starts as soon as the first one is ready
+                intro = ["Welcome to the game! I am the Dungeon Master. Let's begin."] + sent_tokenize(initial_situation)
+                await enqueue_tts_batch(intro, DM_VOICE)
+            #
+
+            logger.info("Starting the game... v 0.22 \n--------------------\n")
+            logger.info(initial_situation)
+            logger.info("---------")
+
             the_story_so_far = initial_situation
             for player in player_characters:
-                the_story_so_far = await game_master.execute_player_turn(player, the_story_so_far, logger, connected_clients)
+                the_story_so_far = await game_master.execute_player_turn(player, the_story_so_far, logger, broadcast)
                 logger.info("-------the story so far -------------\n")
                 logger.info(the_story_so_far)
                 logger.info("---------and now...-----------\n")        
             # 
             await flush_audio_queue()   
 
-        logger.info("DONE Part 2: main")
-        # Signal the playback worker to shut down (only if you want a controlled exit)
-
-         # Ensure playback worker finishes
-        await playback_task
+            logger.info("DONE Part 2: main")
+            await audio_queue.put(None)  # Send termination signal to playback worker
+        #
         logger.info("Playback worker terminated.")
 
-    except Exception as e:
-        logger.info(f"Error in main: {e}")
+    except* Exception as errors:
+        # Failures inside the task group arrive as an ExceptionGroup: report each one
+        for error in errors.exceptions:
+            logger.error(f"Error in main: {error}", exc_info=error)
     finally:
-        await audio_queue.put(None)  # Send termination signal to playback worker
-        #await playback_task  # Ensure playback task completes
-        logger.info("Playback worker terminated.")
+        if prewarm_task is not None:
+            prewarm_task.cancel()  # No-op once it has finished
+            await asyncio.gather(prewarm_task, return_exceptions=True)
+        await get_default_model_caller().aclose()  # Release pooled LLM connections
     #
     logger.info("DONE DONE: main")
 
@@ -1,2 +1,2 @@
 #!/bin/bash
-uvicorn server:app --host 0.0.0.0 --port 8000 --reload
+uvicorn server:app --host 0.0.0.0 --port 8000 --loop uvloop --reload
@@ -1,18 +1,18 @@
 # server.py
 # -------------------
 import asyncio
-import yaml
-import sys
+import gzip
+import json
 import logging
 import os
+from typing import Optional
 # -------------------
-from fastapi import FastAPI, WebSocket, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, WebSocket, HTTPException, Request, Response
 from fastapi.websockets import WebSocketDisconnect  # Add this import
 from fastapi.staticfiles import StaticFiles
 # -------------------
-from run_game import main as run_game_main
 from core.job_manager import enqueue_user_input_job
+from core.config import load_yaml
 # -------------------
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -20,47 +20,100 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
-# Ensure the audio directory exists
-os.makedirs("static/audio", exist_ok=True)
-
 # Mount the static files route
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# Load the initial situation from YAML
-with open("game_config.yaml", "r") as f:
-    config = yaml.safe_load(f)
-initial_situation = config["initial_situation"]
+def load_config(path: str = "game_config.yaml"):
+    return load_yaml(path)
+
+def load_initial_situation() -> str:
+    return load_config()["initial_situation"]
 
-# Store WebSocket connections for broadcasting logs
-connected_clients = []
+# Connected WebSocket clients, each with the queue of frames its drain_client task is sending
+connected_clients: dict[WebSocket, asyncio.Queue] = {}
+# Frames a client may have waiting before it is considered too slow and disconnected
+CLIENT_QUEUE_SIZE = 256
 
 @app.on_event("startup")
 async def start_game():
-    logger.info("!!!Starting game with initial situation: %s", initial_situation)  # Debug info
-    print("@@@Starting game with initial situation: ", initial_situation) 
-    logger.info("LOGGER = %s", logger)
-    asyncio.create_task(run_game_main(initial_situation, connected_clients, logger))
+    # The game and its config are loaded when the server starts, not whenever this module is imported
+    from run_game import main as run_game_main
+    initial_situation = load_initial_situation()
+
+    os.makedirs("static/audio", exist_ok=True)  # Clips are copied here to be served to the page
+    logger.info("Starting game with initial situation: %s", initial_situation)
+    global console_loop
+    console_loop = asyncio.get_running_loop()
+    asyncio.create_task(broadcast_console())
+    asyncio.create_task(run_game_main(initial_situation, broadcast, logger))
+
+# The console page is read (and gzipped) once and served from memory
+with open("static/index.html", "rb") as f:
+    CONSOLE_PAGE = f.read()
+CONSOLE_PAGE_GZIP = gzip.compress(CONSOLE_PAGE, compresslevel=9)
+CONSOLE_PAGE_HEADERS = {"cache-control": "public, max-age=60", "vary": "accept-encoding"}
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """True if an Accept-Encoding header allows gzip (explicitly or through *) with a q-value above 0."""
+    q_values = {}
+    for item in accept_encoding.split(","):
+        encoding, _, params = item.partition(";")
+        encoding = encoding.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        q_values[encoding] = q
+    q = q_values.get("gzip", q_values.get("*", 0.0))
+    return q > 0
 
 @app.get("/")
-async def get_console():
-    logger.info("Serving console page...")  # Debug info
-    return HTMLResponse(html_content)
+async def get_console(request: Request):
+    if accepts_gzip(request.headers.get("accept-encoding", "")):
+        return Response(
+            content=CONSOLE_PAGE_GZIP,
+            media_type="text/html",
+            headers={**CONSOLE_PAGE_HEADERS, "content-encoding": "gzip"}
+        )
+    return Response(content=CONSOLE_PAGE, media_type="text/html", headers=CONSOLE_PAGE_HEADERS)
+
+# Audio clips are named after a hash of their voice and text, so a URL always serves the same bytes
+@app.middleware("http")
+async def cache_audio_clips(request: Request, call_next):
+    response = await call_next(request)
+    if request.url.path.startswith("/static/audio/") and response.status_code == 200:
+        response.headers["cache-control"] = "public, max-age=31536000, immutable"
+    return response
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     logger.info("WebSocket connection established.")
     await websocket.accept()
-    connected_clients.append(websocket)
+    # Frames for this client are queued and sent by its own task, so a slow client only delays itself
+    client_queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+    connected_clients[websocket] = client_queue
+    drain_task = asyncio.create_task(drain_client(websocket, client_queue))
 
     try:
         while True:
-            data = await websocket.receive_text()
+            # The page sends {"type": "input", "value": ...}
+            text = await websocket.receive_text()
+            try:
+                data = json.loads(text)
+            except json.JSONDecodeError:
+                data = None
+            if not isinstance(data, dict):
+                logger.debug("Ignoring malformed message from client: %r", text)
+                continue
             logger.info("Received data from client: %s", data)
 
-            if data.startswith("INPUT:"):
-                user_input_value = data.split("INPUT:")[1].strip()
+            if data.get("type") == "input":
+                user_input_value = str(data.get("value", "")).strip()
                 logger.info("User input received: %s", user_input_value)
-                print(f"User input received: {user_input_value}")
                 await enqueue_user_input_job(user_input_value)
 
     except WebSocketDisconnect:
@@ -68,166 +121,116 @@ async def websocket_endpoint(websocket: WebSocket):
     except Exception as e:
         logger.error("WebSocket error: %s", e)
     finally:
-        connected_clients.remove(websocket)
+        drop_client(websocket)
+        drain_task.cancel()
         logger.info("WebSocket connection removed.")
 
-# Redirect print statements to WebSocket clients for console output
-class WebSocketConsole:
-    def write(self, message):
-        for client in connected_clients[:]:  # Iterate over a copy of the list
-            try:
-                asyncio.create_task(client.send_text(message))
-            except Exception as e:
-                logger.error("Failed to send message to WebSocket client: %s", e)
-                connected_clients.remove(client)  # Remove disconnected clients
-    def flush(self):
-        pass
-
-# Redirect standard output to WebSocketConsole
-print("=============1")
-logger.info("-------------1")
-logger.info("Redirecting stdout to WebSocketConsole.")
-sys.stdout = WebSocketConsole()
-print("=============2")
-logger.info("-------------2")
-
-# HTML content for the console interface
-html_content = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-  <meta charset="UTF-8">
-  <title>Game Console</title>
-  <style>
-    #console {
-      font-family: monospace;
-      background: #222;
-      color: #eee;
-      padding: 10px;
-      max-height: 80vh;
-      overflow-y: auto;  /* Scrollable when content overflows */
-      height: 60vh;  /* Initial height to view more lines */
-      border: 1px solid #444;
-      margin-bottom: 10px;
-    }
-    #input-container {
-      display: flex;
-      margin-top: 10px;
-    }
-    #user-input {
-      flex: 1;
-      padding: 10px;
-      font-size: 16px;
-      color: #333;
-    }
-  </style>
-</head>
-<body>
-  <div id="console"></div>
-  <div id="input-container">
-    <input id="user-input" placeholder="Type your input here..." onkeypress="handleKeyPress(event)">
-  </div>
-
-  <script>
-    const consoleDiv = document.getElementById("console");
-    const userInput = document.getElementById("user-input");
-    const ws = new WebSocket("ws://localhost:8000/ws");
-
-    const audioQueue = [];  // Queue to store audio URLs
-    let isPlaying = false;  // Flag to check if audio is currently playing
-
-    // Function to play the next audio in the queue
-    function playNextAudio() {
-        // Check if already playing or queue is empty
-        console.log("Playing next audio...");
-        console.log("Is Playing: ", isPlaying)
-        console.log("Audio Queue Length: ", audioQueue.length)
-        
-        if (isPlaying || audioQueue.length === 0) return;
-
-        isPlaying = true;  // Set flag to indicate that audio is playing
-        const audioUrl = audioQueue.shift();  // Get the next audio URL
-
-        const audio = new Audio(audioUrl);
-        audio.play();
-
-        // Event listener to handle when audio finishes
-        audio.onended = function() {
-            isPlaying = false;  // Reset flag
-            playNextAudio();    // Play the next audio in the queue
-        };
-
-        // Optional: Handle audio errors to avoid playback blocking
-        audio.onerror = function() {
-            console.error("Error playing audio:", audioUrl);
-            isPlaying = false;
-            playNextAudio();  // Try to play the next audio even if there's an error
-        };
-    }
-
-    // Confirm WebSocket connection
-    ws.onopen = function() {
-        console.log("WebSocket connection established.");
-    };
-
-    // WebSocket error handling
-    ws.onerror = function(error) {
-        console.error("WebSocket error:", error);
-    };
-
-    // WebSocket close handling
-    ws.onclose = function() {
-        console.log("WebSocket connection closed.");
-    };
-
-    // Display incoming messages
-    ws.onmessage = function(event) {
-      const message = event.data;
-      console.log("Received message from server:", message);  // Debug info
-      const messageElement = document.createElement("div");
-      messageElement.textContent = message;
-      consoleDiv.appendChild(messageElement);
-
-      // Auto-scroll to the bottom
-      consoleDiv.scrollTop = consoleDiv.scrollHeight;
-    };
-
-    // Send user input to the server
-    function handleKeyPress(event) {
-      if (event.key === "Enter") {
-        const input = userInput.value;
-        console.log("Sending user input to server:", input);  // Debug info
-        ws.send("INPUT:" + input);
-        userInput.value = "";  // Clear input field
-      }
-    }
-
-      // WebSocket message handler
-    ws.onmessage = function(event) {
-        const message = event.data;
-
-        if (message.startsWith("AUDIO:")) {
-            const audioUrl = message.replace("AUDIO:", "").trim();
-            console.log("---> Received audio URL:", audioUrl);
-
-            // Add audio URL to the queue and attempt to play
-            console.log("Adding audio to queue:", audioUrl);
-            console.log("Audio Queue Length:", audioQueue.length);
-            console.log("Is Playing:", isPlaying);
-
-            audioQueue.push(audioUrl);
-            playNextAudio();  // Start playback if not already playing
-        } else {
-            // Handle other messages as usual
-            const messageElement = document.createElement("div");
-            messageElement.textContent = message;
-            document.getElementById("console").appendChild(messageElement);
-            document.getElementById("console").scrollTop = consoleDiv.scrollHeight;
-        }
-    };
-
-  </script>
-</body>
-</html>
-"""
+def drop_client(websocket: WebSocket):
+    connected_clients.pop(websocket, None)
+
+def broadcast(frame: dict):
+    """Queue a frame for every connected client. This is the only way anything is sent to the clients."""
+    if not connected_clients:
+        return
+    message = json.dumps(frame)
+    for websocket, client_queue in tuple(connected_clients.items()):
+        try:
+            client_queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Unregister now, so later frames don't evict it again; closing happens in one task
+            drop_client(websocket)
+            logger.warning("WebSocket client is not keeping up, disconnecting it.")
+            close_task = asyncio.create_task(close_client(websocket))
+            closing_tasks.add(close_task)
+            close_task.add_done_callback(closing_tasks.discard)
+
+async def drain_client(websocket: WebSocket, client_queue: asyncio.Queue):
+    try:
+        while True:
+            await websocket.send_text(await client_queue.get())
+    except Exception as e:
+        logger.error("Failed to send message to WebSocket client: %s", e)
+        drop_client(websocket)
+
+# Close tasks for evicted clients, kept here until they finish
+closing_tasks: set[asyncio.Task] = set()
+
+async def close_client(websocket: WebSocket):
+    try:
+        await websocket.close()  # Ends the client's receive loop in websocket_endpoint
+    except Exception as e:
+        logger.error("Error closing WebSocket client: %s", e)
+
+# Console output waiting to be broadcast to the WebSocket clients
+console_queue = asyncio.Queue(maxsize=4096)
+# A warning is logged every time this many lines have been dropped from a full queue
+CONSOLE_DROP_WARNING_EVERY = 500
+console_dropped = 0
+
+# When more output is already pending, wait this many seconds for the rest of the burst before sending
+CONSOLE_BATCH_WINDOW = 0.02
+# Most lines sent in one frame
+CONSOLE_BATCH_MAX_LINES = 256
+
+async def next_console_batch() -> list[str]:
+    batch = [await console_queue.get()]
+    if not console_queue.empty():
+        await asyncio.sleep(CONSOLE_BATCH_WINDOW)  # A lone line goes out immediately
+    while not console_queue.empty() and len(batch) < CONSOLE_BATCH_MAX_LINES:
+        batch.append(console_queue.get_nowait())
+    # Each record ends with a newline and may itself span several lines
+    return "".join(batch).splitlines()
+
+async def broadcast_console():
+    # Single producer for all console output; each client's drain_client task does the sending
+    while True:
+        lines = await next_console_batch()
+        # One frame per batch; the page appends all its lines in a single DOM update
+        broadcast({"t": "log", "lines": lines})  # Dropped without encoding when nobody is listening
+
+# Loop running broadcast_console, set once the server has started
+console_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def enqueue_console(message: str):
+    global console_dropped
+    if console_queue.full():
+        console_queue.get_nowait()  # Drop the oldest line rather than grow without bound
+        console_dropped += 1
+        if console_dropped % CONSOLE_DROP_WARNING_EVERY == 0:
+            # Terminal only: a record sent to the console handler would land back in this queue
+            console_drop_logger.warning("Web console is falling behind: %d lines dropped so far", console_dropped)
+    console_queue.put_nowait(message)
+
+# Send the game's log records (not every print in the process) to the WebSocket clients
+class WebSocketLogHandler(logging.Handler):
+    def emit(self, record):
+        try:
+            message = self.format(record) + "\n"
+        except Exception:
+            self.handleError(record)
+            return
+        # Records can come from worker threads; asyncio queues may only be touched from the loop's thread
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if console_loop is None or running_loop is console_loop:
+            enqueue_console(message)
+        else:
+            console_loop.call_soon_threadsafe(enqueue_console, message)
+
+# Not in CONSOLE_LOGGERS, so its records only reach the terminal
+console_drop_logger = logging.getLogger("web_console")
+
+# Loggers whose records are shown in the web console
+CONSOLE_LOGGERS = ("server", "run_game", "dnd", "core", "audio")
+# Chatty third-party loggers kept out of the console
+QUIET_LOGGERS = ("httpx", "httpcore", "openai", "elevenlabs")
+
+websocket_log_handler = WebSocketLogHandler()
+websocket_log_handler.setFormatter(logging.Formatter("%(message)s"))
+for name in CONSOLE_LOGGERS:
+    logging.getLogger(name).addHandler(websocket_log_handler)
+for name in QUIET_LOGGERS:
+    logging.getLogger(name).setLevel(logging.WARNING)
 